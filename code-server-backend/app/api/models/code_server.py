@@ -7,6 +7,8 @@ class CodeServerAction(str, Enum):
     STOP = "STOP"
     PAUSE = "PAUSE"
     UNPAUSE = "UNPAUSE"
+    HIBERNATE = "HIBERNATE"
+    RESUME = "RESUME"
     DELETE = "DELETE"
 
 class CodeServerStatusChange(BaseModel):
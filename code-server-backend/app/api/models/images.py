@@ -0,0 +1,29 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+class PullStatus(str, Enum):
+    QUEUED = "QUEUED"
+    PULLING = "PULLING"
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+
+class PullImage(BaseModel):
+    image: str
+
+class LayerProgress(BaseModel):
+    status: str
+    current: int = 0
+    total: int = 0
+
+class ImagePullProgress(BaseModel):
+    image: str
+    status: PullStatus = PullStatus.QUEUED
+    source: Optional[str] = None
+    layers: Dict[str, LayerProgress] = {}
+    downloadedBytes: int = 0
+    totalBytes: int = 0
+    error: Optional[str] = None
+    startedAt: Optional[datetime] = None
+    completedAt: Optional[datetime] = None
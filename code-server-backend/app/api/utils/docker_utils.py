@@ -1,5 +1,7 @@
+import os
+import subprocess
 from io import BytesIO
-from typing import AsyncGenerator, List
+from typing import AsyncGenerator, List, Optional
 import docker
 from fastapi import HTTPException, status
 from app.api.utils.logger_utils import get_logger
@@ -43,7 +45,7 @@ def perform_docker_actions(container_name: str, commands: List[str], user:str):
             detail="Something went wrong while running docker actions"
         )
 
-async def log_generator(fileobj: BytesIO, tag: str, dockerScriptId: str) -> AsyncGenerator[str, None]:
+async def log_generator(fileobj: BytesIO, tag: str, dockerScriptId: str, pull: bool = True) -> AsyncGenerator[str, None]:
     started_at = datetime.now()
     completed_at = None
     build_status = None
@@ -69,7 +71,7 @@ async def log_generator(fileobj: BytesIO, tag: str, dockerScriptId: str) -> Asyn
             print(f"[ERROR] Failed to log buildinfo: {log_err}")
 
     try:
-        for chunk in client.api.build(fileobj=fileobj, rm=True, decode=True, pull=True, tag=tag):
+        for chunk in client.api.build(fileobj=fileobj, rm=True, decode=True, pull=pull, tag=tag):
             if 'stream' in chunk:
                 yield chunk['stream']
 
@@ -140,4 +142,21 @@ def restart_container(container_name: str):
     except docker.errors.NotFound:
         raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def run_code_server_container(container_name: str, image_name: str, port: int, create_only: bool = False,
+                              entrypoint: Optional[str] = None, args: Optional[List[str]] = None) -> subprocess.CompletedProcess:
+    """Runs (or, with `create_only`, just creates) a code-server container published on the given port."""
+    user_home = os.path.expanduser("~")
+    cmd = [
+        "docker", "create" if create_only else "run",
+        *([] if create_only else ["-d"]),
+        *(["--entrypoint", entrypoint] if entrypoint else []),
+        "--name", container_name,
+        "-p", f"{os.getenv('BASE_API_HOST')}:{port}:8080",
+        "-v", f"{user_home}/.config:/home/coder/.config",
+        image_name,
+        *(args if args is not None else ["--auth", "none"])
+    ]
+    return subprocess.run(cmd, capture_output=True, text=True)
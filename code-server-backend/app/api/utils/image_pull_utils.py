@@ -0,0 +1,433 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+import docker
+from docker.auth import resolve_repository_name
+from docker.utils import parse_repository_tag
+from fastapi import HTTPException, status
+from prisma.enums import CredentialType
+
+from app.api.db.db import prisma
+from app.api.models.images import ImagePullProgress, LayerProgress, PullStatus
+from app.api.utils.docker_utils import client
+from app.api.utils.logger_utils import get_logger
+
+logger = get_logger('ImagePullUtils')
+
+DEFAULT_REGISTRIES = {
+    CredentialType.DOCKERHUB.value: "docker.io",
+    CredentialType.GITHUB_CONTAINER.value: "ghcr.io",
+}
+
+DOCKER_HUB_ALIASES = ("docker.io", "index.docker.io", "registry-1.docker.io", "hub.docker.com")
+
+# Web hosts users may enter as the GHCR base URL; they are not registry endpoints
+GITHUB_WEB_HOSTS = ("github.com", "www.github.com", "api.github.com")
+
+LOCAL_REGISTRY_CONTAINER = "code-server-registry"
+
+FROM_PATTERN = re.compile(r"^\s*FROM\s+(?:--\S+\s+)*(\S+)(?:\s+AS\s+(\S+))?", re.IGNORECASE | re.MULTILINE)
+
+
+def is_digest(tag: Optional[str]) -> bool:
+    return bool(tag) and tag.startswith("sha256:")
+
+
+def normalize_image(image: str) -> str:
+    """Returns the image reference with an explicit tag ('latest' when omitted)."""
+    repository, tag = parse_repository_tag(image)
+    separator = "@" if is_digest(tag) else ":"
+    return f"{repository}{separator}{tag or 'latest'}"
+
+
+def canonical_image(image: str) -> str:
+    """Returns one spelling per image (`ubuntu`, `docker.io/library/ubuntu:latest`, ...), used as the dedupe key."""
+    repository, tag = parse_repository_tag(normalize_image(image))
+    registry, repo_name = resolve_repository_name(repository)
+    if registry in DOCKER_HUB_ALIASES:
+        registry = "docker.io"
+        if "/" not in repo_name:
+            repo_name = f"library/{repo_name}"
+    separator = "@" if is_digest(tag) else ":"
+    return f"{registry}/{repo_name}{separator}{tag}"
+
+
+def get_credential_registry(credential_type: str, base_url: Optional[str]) -> str:
+    """Returns the registry host a stored credential authenticates against.
+
+    Docker Hub credentials always map to `docker.io`; the base URL is only honoured
+    for other registry types, and only when it names a registry rather than a website.
+    """
+    if credential_type == CredentialType.DOCKERHUB.value:
+        return "docker.io"
+    host = re.sub(r"^https?://", "", base_url or "").split("/")[0].lower()
+    if host in DOCKER_HUB_ALIASES:
+        return "docker.io"
+    if not host or host in GITHUB_WEB_HOSTS:
+        return DEFAULT_REGISTRIES[credential_type]
+    return host
+
+
+def get_mirror_repository(mirror: str, repository: str) -> str:
+    """Maps an upstream repository to its path on the mirror.
+
+    Docker Hub images keep the layout a pull-through cache expects (`library/` for
+    official images); other registries are namespaced by their host so that e.g.
+    `ghcr.io/foo/bar` and `foo/bar` never collide.
+    """
+    registry, repo_name = resolve_repository_name(repository)
+    if registry in DOCKER_HUB_ALIASES:
+        if "/" not in repo_name:
+            repo_name = f"library/{repo_name}"
+        return f"{mirror}/{repo_name}"
+    return f"{mirror}/{registry}/{repo_name}"
+
+
+def get_base_images(docker_file: str) -> List[str]:
+    """Returns the external base images named in the FROM lines of a Dockerfile."""
+    stages = set()
+    bases = []
+    for match in FROM_PATTERN.finditer(docker_file):
+        image, alias = match.group(1), match.group(2)
+        if image.lower() != "scratch" and "$" not in image and image.lower() not in stages:
+            bases.append(normalize_image(image))
+        if alias:
+            stages.add(alias.lower())
+    return list(dict.fromkeys(bases))
+
+
+def image_exists(image: str) -> bool:
+    try:
+        client.images.get(image)
+        return True
+    except docker.errors.ImageNotFound:
+        return False
+
+
+def ensure_local_registry(port: int = 5000, proxy_remote_url: Optional[str] = None,
+                          name: str = LOCAL_REGISTRY_CONTAINER) -> str:
+    """Starts a local `registry:2` container (if not running) and returns its address.
+
+    Without `proxy_remote_url` it is a plain registry to seed with `seed_local_registry`
+    (the stand-in registry used by the tests). With e.g. `https://registry-1.docker.io`
+    it runs as a Docker Hub pull-through cache suitable as REGISTRY_MIRROR; a registry in
+    proxy mode rejects pushes, so it cannot be seeded.
+    """
+    try:
+        container = client.containers.get(name)
+        if container.status != "running":
+            container.start()
+    except docker.errors.NotFound:
+        logger.info(f"Starting local registry '{name}' on port {port}")
+        environment = {"REGISTRY_PROXY_REMOTEURL": proxy_remote_url} if proxy_remote_url else {}
+        client.containers.run(
+            "registry:2",
+            name=name,
+            detach=True,
+            environment=environment,
+            ports={"5000/tcp": ("127.0.0.1", port)},
+            restart_policy={"Name": "unless-stopped"},
+        )
+    return f"localhost:{port}"
+
+
+def seed_local_registry(image: str, registry: str) -> str:
+    """Pushes a locally available image into the given registry and returns the mirrored reference."""
+    repository, tag = parse_repository_tag(normalize_image(image))
+    mirror_repository = get_mirror_repository(registry, repository)
+    client.api.tag(image, mirror_repository, tag)
+    for chunk in client.api.push(mirror_repository, tag=tag, stream=True, decode=True):
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"])
+    return f"{mirror_repository}:{tag}"
+
+
+class ImagePullManager:
+    """Authenticated, deduplicated image pulls with progress tracking and background prefetch."""
+
+    def __init__(self):
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, ImagePullProgress] = {}
+        # Progress is written from pull worker threads and read on the event loop
+        self._progress_lock = threading.Lock()
+        self._prefetch_task: Optional[asyncio.Task] = None
+        self._manual_prefetch_task: Optional[asyncio.Task] = None
+
+    # Settings are read lazily so values from .env (loaded after import) are honoured
+    @property
+    def max_concurrency(self) -> int:
+        return int(os.getenv("PULL_MAX_CONCURRENCY", "2"))
+
+    @property
+    def prefetch_concurrency(self) -> int:
+        return int(os.getenv("PREFETCH_MAX_CONCURRENCY", "1"))
+
+    @property
+    def prefetch_rate(self) -> float:
+        """Average prefetch rate in bytes per second (configured in megabits/s), 0 for unlimited."""
+        return float(os.getenv("PREFETCH_MAX_AVG_RATE_MBITS", "0")) * 1_000_000 / 8
+
+    @property
+    def prefetch_interval(self) -> int:
+        return int(os.getenv("PREFETCH_INTERVAL_SECONDS", "900"))
+
+    @property
+    def prefetch_recent_instances(self) -> int:
+        return int(os.getenv("PREFETCH_RECENT_INSTANCES", "20"))
+
+    @property
+    def mirror(self) -> Optional[str]:
+        return os.getenv("REGISTRY_MIRROR") or None
+
+    @property
+    def progress_ttl(self) -> int:
+        return int(os.getenv("PULL_PROGRESS_TTL_SECONDS", "3600"))
+
+    @property
+    def progress_max_entries(self) -> int:
+        return int(os.getenv("PULL_PROGRESS_MAX_ENTRIES", "200"))
+
+    def get_progress(self, image: Optional[str] = None) -> List[ImagePullProgress]:
+        with self._progress_lock:
+            if image:
+                progress = self._progress.get(canonical_image(image))
+                progresses = [progress] if progress else []
+            else:
+                progresses = list(self._progress.values())
+            return [progress.model_copy(deep=True) for progress in progresses]
+
+    def _evict_finished_progress(self):
+        """Drops finished pulls older than the TTL, then the oldest ones beyond the entry cap."""
+        now = datetime.now()
+        with self._progress_lock:
+            finished = sorted(
+                (p for p in self._progress.values() if p.completedAt is not None),
+                key=lambda p: p.completedAt,
+            )
+            expired = [p for p in finished if (now - p.completedAt).total_seconds() > self.progress_ttl]
+            overflow = max(0, len(self._progress) - len(expired) - self.progress_max_entries)
+            remaining = [p for p in finished if p not in expired]
+            for progress in expired + remaining[:overflow]:
+                self._progress.pop(progress.image, None)
+
+    async def get_auth_configs(self) -> Dict[str, dict]:
+        """Maps registry hostnames to auth configs built from the stored registry credentials."""
+        credentials = await prisma.credentials.find_many(
+            where={"type": {"in": list(DEFAULT_REGISTRIES.keys())}}
+        )
+        auth_configs = {}
+        for credential in credentials:
+            registry = get_credential_registry(credential.type, credential.baseUrl)
+            auth_configs[registry] = {"username": credential.username, "password": credential.token}
+        return auth_configs
+
+    async def login_registries(self):
+        """Logs the docker client into every registry with stored credentials, so builds pull authenticated."""
+        for registry, auth_config in (await self.get_auth_configs()).items():
+            try:
+                await asyncio.to_thread(
+                    client.login,
+                    username=auth_config["username"],
+                    password=auth_config["password"],
+                    registry=None if registry == "docker.io" else registry,
+                )
+            except Exception as e:
+                logger.warning(f"Registry login failed for '{registry}': {e}")
+
+    async def ensure_image(self, image: str) -> Optional[ImagePullProgress]:
+        """Pulls the image only if it is not already available locally."""
+        if await asyncio.to_thread(image_exists, image):
+            return None
+        return await self.pull(image)
+
+    async def pull(self, image: str) -> ImagePullProgress:
+        """Pulls an image; concurrent calls for the same image share a single pull.
+
+        Pulls are keyed by the canonical reference, while the reference of the first
+        caller is the one pulled and tagged.
+        """
+        reference = normalize_image(image)
+        key = canonical_image(image)
+        task = self._inflight.get(key)
+        if task is None:
+            self._evict_finished_progress()
+            with self._progress_lock:
+                self._progress[key] = ImagePullProgress(image=key)
+            task = asyncio.create_task(self._run_pull(key, reference))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"Joining in-flight pull of '{key}'")
+        return await asyncio.shield(task)
+
+    async def _run_pull(self, key: str, image: str) -> ImagePullProgress:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = self._progress[key]
+
+        async with self._semaphore:
+            with self._progress_lock:
+                progress.status = PullStatus.PULLING
+                progress.startedAt = datetime.now()
+            try:
+                auth_configs = await self.get_auth_configs()
+                await asyncio.to_thread(self._pull_blocking, image, auth_configs, progress)
+                with self._progress_lock:
+                    progress.status = PullStatus.SUCCESS
+                logger.info(f"Pulled '{image}' from '{progress.source}' ({progress.totalBytes} bytes)")
+            except Exception as e:
+                with self._progress_lock:
+                    progress.status = PullStatus.FAILED
+                    progress.error = str(e)
+                logger.error(f"Failed to pull '{image}': {e}")
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Image pull failed: {image}"
+                )
+            finally:
+                with self._progress_lock:
+                    progress.completedAt = datetime.now()
+        return progress
+
+    def _pull_blocking(self, image: str, auth_configs: Dict[str, dict], progress: ImagePullProgress):
+        repository, tag = parse_repository_tag(image)
+        registry, _ = resolve_repository_name(repository)
+        if registry in DOCKER_HUB_ALIASES:
+            registry = "docker.io"
+
+        sources = []
+        if self.mirror:
+            sources.append((get_mirror_repository(self.mirror, repository), None))
+        sources.append((repository, auth_configs.get(registry)))
+
+        last_error = None
+        for source, auth_config in sources:
+            with self._progress_lock:
+                progress.source = source
+                progress.layers = {}
+            try:
+                for chunk in client.api.pull(source, tag=tag, stream=True, decode=True, auth_config=auth_config):
+                    if "error" in chunk:
+                        raise RuntimeError(chunk["error"])
+                    self._record_progress(progress, chunk)
+                # A digest is not a valid tag; the image is addressable by digest once pulled anyway
+                if source != repository and not is_digest(tag):
+                    client.api.tag(f"{source}:{tag}", repository, tag)
+                return
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Pull of '{image}' from '{source}' failed: {e}")
+        raise last_error
+
+    def _record_progress(self, progress: ImagePullProgress, chunk: dict):
+        layer_id = chunk.get("id")
+        if not layer_id or "progressDetail" not in chunk:
+            return
+        with self._progress_lock:
+            layer = progress.layers.setdefault(layer_id, LayerProgress(status=chunk.get("status", "")))
+            layer.status = chunk.get("status", layer.status)
+            detail = chunk.get("progressDetail") or {}
+            if layer.status == "Downloading":
+                layer.current = detail.get("current", layer.current)
+                layer.total = detail.get("total", layer.total)
+            elif layer.status in ("Download complete", "Pull complete"):
+                layer.current = layer.total
+            progress.downloadedBytes = sum(l.current for l in progress.layers.values())
+            progress.totalBytes = sum(l.total for l in progress.layers.values())
+
+    def _downloaded_bytes(self, images: List[str]) -> int:
+        with self._progress_lock:
+            return sum(self._progress[image].downloadedBytes for image in images if image in self._progress)
+
+    async def get_prefetch_images(self) -> List[str]:
+        """Collects DockerScript base images and the images of recently used instances."""
+        images = []
+        scripts = await prisma.dockerscript.find_many()
+        for script in scripts:
+            images.extend(get_base_images(script.dockerFile))
+
+        instances = await prisma.codeserverinstance.find_many(
+            where={"image": {"not": None}},
+            order={"updatedAt": "desc"},
+            take=self.prefetch_recent_instances,
+        )
+        images.extend(normalize_image(instance.image) for instance in instances if instance.image)
+        unique_images = {}
+        for image in images:
+            unique_images.setdefault(canonical_image(image), image)
+        return list(unique_images.values())
+
+    async def prefetch(self):
+        """Pulls missing images in the background, within the prefetch concurrency and average-rate caps.
+
+        The daemon cannot throttle a pull in progress, so the rate cap is a pacer: a new
+        pull only starts once the bytes downloaded so far (including pulls still running)
+        average out under PREFETCH_MAX_AVG_RATE_MBITS. A single large pull can still burst.
+        """
+        images = await self.get_prefetch_images()
+        missing = [image for image in images if not await asyncio.to_thread(image_exists, image)]
+        if not missing:
+            return
+        logger.info(f"Prefetching {len(missing)} image(s): {', '.join(missing)}")
+
+        semaphore = asyncio.Semaphore(self.prefetch_concurrency)
+        started = time.monotonic()
+        completed_bytes = 0
+        running: List[str] = []
+
+        async def wait_for_rate():
+            while True:
+                pulled_bytes = completed_bytes + self._downloaded_bytes(running)
+                wait = pulled_bytes / self.prefetch_rate - (time.monotonic() - started)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(min(wait, 1))
+
+        async def prefetch_one(image: str):
+            nonlocal completed_bytes
+            async with semaphore:
+                if self.prefetch_rate > 0:
+                    await wait_for_rate()
+                running.append(image)
+                try:
+                    progress = await self.pull(image)
+                    completed_bytes += progress.totalBytes
+                except HTTPException:
+                    completed_bytes += self._downloaded_bytes([image])
+                finally:
+                    running.remove(image)
+
+        await asyncio.gather(*(prefetch_one(image) for image in missing))
+
+    async def _prefetch_loop(self):
+        while True:
+            try:
+                await self.prefetch()
+            except Exception as e:
+                logger.error(f"Image prefetch failed: {e}")
+            await asyncio.sleep(self.prefetch_interval)
+
+    def start_prefetch(self):
+        if self._prefetch_task is None:
+            self._prefetch_task = asyncio.create_task(self._prefetch_loop())
+
+    def start_prefetch_once(self):
+        if self._manual_prefetch_task is None or self._manual_prefetch_task.done():
+            self._manual_prefetch_task = asyncio.create_task(self.prefetch())
+
+    async def stop_prefetch(self):
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            try:
+                await self._prefetch_task
+            except asyncio.CancelledError:
+                pass
+            self._prefetch_task = None
+
+
+pull_manager = ImagePullManager()
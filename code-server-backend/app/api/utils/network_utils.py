@@ -1,8 +1,35 @@
 import socket
+import time
+import urllib.request
+from typing import Collection, Optional
 
-def get_safe_port() -> int:
-    """Ask OS for an unused port and close it."""
+def get_safe_port(exclude: Collection[int] = ()) -> int:
+    """Ask OS for an unused port and close it, skipping ports reserved by `exclude`."""
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(('', 0))  # Bind to any available port
+            port = s.getsockname()[1]  # Get port while socket is open
+        if port not in exclude:
+            return port
+
+def is_port_free(host: Optional[str], port: int) -> bool:
+    """Check whether the port can still be bound on the given host."""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('', 0))  # Bind to any available port
-        port = s.getsockname()[1]  # Get port while socket is open
-    return port
+        try:
+            s.bind((host or '', port))
+            return True
+        except OSError:
+            return False
+
+def wait_until_ready(url: str, timeout: float = 120, interval: float = 0.2) -> bool:
+    """Poll the URL until it answers 200, returning False if the timeout expires first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=interval * 5) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(interval)
+    return False
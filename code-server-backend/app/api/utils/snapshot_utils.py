@@ -0,0 +1,259 @@
+import io
+import os
+import posixpath
+import tarfile
+import time
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import docker
+from fastapi import HTTPException, status
+
+from app.api.utils.docker_utils import client, run_code_server_container
+from app.api.utils.logger_utils import get_logger
+from app.api.utils.network_utils import is_port_free
+
+logger = get_logger('SnapshotUtils')
+
+# Paths the daemon manages itself; restoring them into a new container would be wrong
+EXCLUDED_PATHS = ("/dev", "/proc", "/sys", "/etc/hosts", "/etc/hostname", "/etc/resolv.conf", "/etc/mtab")
+
+CHANGE_MODIFIED = 0
+CHANGE_ADDED = 1
+CHANGE_DELETED = 2
+
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# While this file exists the resumed container holds back its entrypoint, so deletions land first
+RESUME_PENDING_MARKER = "/.code-server-resume-pending"
+RESUME_WRAPPER = f'while [ -e {RESUME_PENDING_MARKER} ]; do sleep 0.1; done; exec "$0" "$@"'
+
+
+class _StreamReader(io.RawIOBase):
+    """File-like view over a generator of byte chunks, so tarfile can consume it in stream mode."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _ancestors(path: str) -> Iterator[str]:
+    parent = posixpath.dirname(path)
+    while parent not in ("/", ""):
+        yield parent
+        parent = posixpath.dirname(parent)
+
+
+def _is_excluded(path: str) -> bool:
+    return any(path == excluded or path.startswith(f"{excluded}/") for excluded in EXCLUDED_PATHS)
+
+
+def plan_snapshot(changes: List[Dict]) -> Tuple[List[str], List[str], List[str]]:
+    """Turns `container.diff()` output into added, modified and deleted paths.
+
+    Added paths are archived whole, since their descendants are new too. Modified paths
+    contribute only their own entry: the content of a file, or just the header of a
+    directory (overlay copies a directory up whenever one of its children changes, and
+    archiving it whole would pull the image's files into the snapshot).
+    """
+    paths = sorted(change["Path"] for change in changes)
+    kinds = {change["Path"]: change["Kind"] for change in changes}
+
+    added_paths, modified_paths, deleted_paths = [], [], []
+    covered = set()
+    for path in paths:
+        if _is_excluded(path) or any(ancestor in covered for ancestor in _ancestors(path)):
+            continue
+        kind = kinds[path]
+        if kind == CHANGE_DELETED:
+            deleted_paths.append(path)
+            covered.add(path)
+        elif kind == CHANGE_ADDED:
+            added_paths.append(path)
+            covered.add(path)
+        else:
+            modified_paths.append(path)
+    return added_paths, modified_paths, deleted_paths
+
+
+def _open_archive(container, path: str):
+    """Starts streaming `path` as a tar; unlike `get_archive`, the response can be closed before the end."""
+    api = container.client.api
+    response = api._get(
+        api._url("/containers/{0}/archive", container.id),
+        params={"path": path},
+        stream=True,
+        headers={"Accept-Encoding": "identity"},
+    )
+    api._raise_for_status(response)
+    return response
+
+
+def write_snapshot(container, snapshot_path: str) -> List[str]:
+    """Streams the container's writable layer into a gzipped tar and returns the deleted paths."""
+    added_paths, modified_paths, deleted_paths = plan_snapshot(container.diff() or [])
+    archive_paths = sorted([(path, True) for path in added_paths] + [(path, False) for path in modified_paths])
+    compress_level = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", "1"))
+
+    with tarfile.open(snapshot_path, "w:gz", compresslevel=compress_level) as snapshot:
+        for path, whole in archive_paths:
+            try:
+                response = _open_archive(container, path)
+            except docker.errors.NotFound:
+                continue
+            # get_archive names entries relative to the path's parent directory
+            parent = posixpath.dirname(path).lstrip("/")
+            with closing(response), tarfile.open(fileobj=_StreamReader(response.iter_content(ARCHIVE_CHUNK_SIZE)), mode="r|") as source:
+                for member in source:
+                    member.name = posixpath.join(parent, member.name)
+                    if member.islnk():
+                        member.linkname = posixpath.join(parent, member.linkname)
+                    snapshot.addfile(member, source.extractfile(member) if member.isreg() else None)
+                    if not whole:
+                        break
+    return deleted_paths
+
+
+def snapshot_container(container_name: str, snapshot_path: str) -> dict:
+    """Snapshots the container's writable layer to disk, leaving the container paused.
+
+    The container is only removed by `discard_container` once the snapshot is recorded;
+    `abort_snapshot` undoes this step if recording it fails.
+    """
+    started = time.monotonic()
+    partial_path = f"{snapshot_path}.part"
+    paused = False
+    try:
+        container = client.containers.get(container_name)
+        if container.status == "running":
+            container.pause()
+            paused = True
+
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        deleted_paths = write_snapshot(container, partial_path)
+        os.replace(partial_path, snapshot_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if isinstance(e, docker.errors.NotFound):
+            raise HTTPException(status_code=404, detail=f"Container '{container_name}' not found")
+        if paused:
+            _unpause(container)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    snapshot_size = os.path.getsize(snapshot_path)
+    logger.info(f"Snapshotted '{container_name}' in {duration_ms}ms, {snapshot_size} bytes at '{snapshot_path}'")
+    return {"snapshotSize": snapshot_size, "deletedPaths": deleted_paths, "paused": paused, "durationMs": duration_ms}
+
+
+def _unpause(container):
+    try:
+        container.unpause()
+    except docker.errors.APIError:
+        logger.warning(f"Could not unpause '{container.name}' after failed snapshot")
+
+
+def abort_snapshot(container_name: str, snapshot_path: str, paused: bool):
+    """Drops a snapshot that could not be recorded and lets the container carry on."""
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+    if paused:
+        try:
+            _unpause(client.containers.get(container_name))
+        except docker.errors.NotFound:
+            pass
+
+
+def discard_container(container_name: str):
+    """Removes a container whose snapshot has been recorded, paused or not."""
+    try:
+        client.containers.get(container_name).remove(force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+def _single_file_tar(path: str, content: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo(path.lstrip("/"))
+        info.size = len(content)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def resume_container(container_name: str, image_name: str, snapshot_path: str, deleted_paths: List[str], port: int) -> dict:
+    """Recreates the container from its original image on the same port and applies the snapshot.
+
+    Files are restored before the first start. Deleted paths are removed while the
+    entrypoint is still held back by a marker file, so code-server never sees them.
+    """
+    started = time.monotonic()
+    if not os.path.exists(snapshot_path):
+        raise HTTPException(status_code=404, detail=f"Snapshot '{snapshot_path}' not found")
+    if not is_port_free(os.getenv("BASE_API_HOST"), port):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Port {port} of the hibernated instance is in use by another process"
+        )
+
+    # A container left behind by a hibernate that failed after recording its snapshot
+    discard_container(container_name)
+
+    entrypoint: Optional[str] = None
+    args: Optional[List[str]] = None
+    if deleted_paths:
+        try:
+            image_entrypoint = client.images.get(image_name).attrs["Config"].get("Entrypoint") or []
+        except docker.errors.ImageNotFound:
+            raise HTTPException(status_code=404, detail=f"Image '{image_name}' not found")
+        entrypoint = "/bin/sh"
+        args = ["-c", RESUME_WRAPPER, *image_entrypoint, "--auth", "none"]
+
+    result = run_code_server_container(
+        container_name=container_name, image_name=image_name, port=port,
+        create_only=True, entrypoint=entrypoint, args=args,
+    )
+    if result.returncode != 0:
+        raise HTTPException(status_code=500, detail=f"Instance resume failed: {result.stderr}")
+
+    try:
+        container = client.containers.get(container_name)
+        # The daemon accepts the gzipped tar as is; the file is streamed, not read into memory
+        with open(snapshot_path, "rb") as snapshot:
+            container.put_archive("/", snapshot)
+        if deleted_paths:
+            container.put_archive("/", _single_file_tar(RESUME_PENDING_MARKER, "\n".join(deleted_paths).encode()))
+        container.start()
+
+        if deleted_paths:
+            exit_code, output = container.exec_run(
+                ["sh", "-c", f'tr "\\n" "\\0" < {RESUME_PENDING_MARKER} | xargs -0 rm -rf -- && rm -f {RESUME_PENDING_MARKER}'],
+                user="root",
+            )
+            if exit_code != 0:
+                raise RuntimeError(f"Could not remove deleted paths: {output.decode('utf-8', errors='ignore')}")
+            container.reload()
+            if container.status != "running":
+                raise RuntimeError(f"Container '{container_name}' exited while resuming")
+    except Exception as e:
+        discard_container(container_name)
+        raise HTTPException(status_code=500, detail=f"Instance resume failed: {e}")
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    logger.info(f"Resumed '{container_name}' in {duration_ms}ms")
+    return {"durationMs": duration_ms}
@@ -1,13 +1,18 @@
+import asyncio
 import os
-import subprocess
 import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
 from fastapi import APIRouter, HTTPException
 from app.api.db.db import prisma
 from app.api.models.code_server import CodeServerCreate, CodeServerStatusChange
 from app.api.models.response import SuccessResponse
 from app.api.utils.network_utils import get_safe_port
 from prisma.enums import CredentialType, InstanceStatus
-from app.api.utils import docker_utils
+from app.api.utils import docker_utils, snapshot_utils
+from app.api.utils.image_pull_utils import pull_manager
+from prisma import Json
 import json
 
 from app.api.utils.logger_utils import get_logger
@@ -19,6 +24,19 @@ code_server_router = APIRouter(
     tags=["Code Server API Management"]
 )
 
+# Per-instance locks; a single API process owns the Docker host
+instance_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+CLEARED_SNAPSHOT = {
+    "snapshotPath": None,
+    "snapshotDeletedPaths": Json([]),
+    "snapshotSize": None,
+    "hibernatedAt": None,
+}
+
+def get_snapshot_dir() -> str:
+    return os.getenv("SNAPSHOT_DIR") or os.path.join(os.path.expanduser("~"), ".code-server-manager", "snapshots")
+
 @code_server_router.get("/", response_model=SuccessResponse)
 async def get_code_servers():
     code_servers = await prisma.codeserverinstance.find_many()
@@ -26,7 +44,9 @@ async def get_code_servers():
 
 @code_server_router.post("/", response_model=SuccessResponse)
 async def create_code_servers( create_code_server : CodeServerCreate):
-    port = get_safe_port()
+    # Ports stay reserved for every stored instance, hibernated ones included, since they resume on the same URL
+    used_ports = {instance.port for instance in await prisma.codeserverinstance.find_many()}
+    port = get_safe_port(exclude=used_ports)
     container_name = f"{create_code_server.name}"
     user_home = os.path.expanduser("~")
     image_name = f"{create_code_server.image}"
@@ -43,21 +63,18 @@ async def create_code_servers( create_code_server : CodeServerCreate):
         json.dump(settings, f, indent=2)
 
 
-    # Step 1: Start Docker container
-    cmd = [
-        "docker", "run", "-d",
-        "--name", container_name,
-        "-p", f"{os.getenv('BASE_API_HOST')}:{port}:8080",
-        "-v", f"{user_home}/.config:/home/coder/.config",
-        image_name,
-        "--auth", "none"
-    ]
+    # Step 1: Make sure the image is present (authenticated pull, shared with prefetch)
+    try:
+        await pull_manager.ensure_image(image_name)
+    except HTTPException:
+        logger.warning(f"Pre-pull of '{image_name}' failed, falling back to docker run")
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    # Step 2: Start Docker container
+    result = docker_utils.run_code_server_container(container_name=container_name, image_name=image_name, port=port)
     if result.returncode != 0:
         raise HTTPException(status_code=500, detail=f"Instance creation failed: {result.stderr}")
 
-    # Step 2: Save instance to DB
+    # Step 3: Save instance to DB
     url = f"{os.getenv('BASE_API_POINT')}:{port}"
     code_server_instance = await prisma.codeserverinstance.create(
         data={
@@ -70,7 +87,7 @@ async def create_code_servers( create_code_server : CodeServerCreate):
         }
     )
 
-    # # Step 3: Fetch GitHub credentials
+    # # Step 4: Fetch GitHub credentials
     # github_credential = await prisma.credentials.find_first(
     #     where={"type": CredentialType.GITHUB.value}
     # )
@@ -121,50 +138,115 @@ async def get_code_server(instance_id: str):
 @code_server_router.post("/{instance_id}/change-status", response_model=SuccessResponse)
 async def update_code_server_action(instance_id: str, actionableObject: CodeServerStatusChange):
     try:
-        instance = await prisma.codeserverinstance.find_unique(
-            where={"id": instance_id},
-            include={"activities": True}
-        )
-
-        if not instance:
-            raise HTTPException(status_code=404, detail="Code server instance not found")
-
-        container_name = instance.name
-        action = actionableObject.action.upper()
-        new_status = None
-
-        docker_command = []
-
-        if action == "START":
-            docker_utils.start_container(container_name=container_name)
-            new_status = "RUNNING"
-        elif action == "STOP":
-            docker_utils.stop_container(container_name=container_name)
-            new_status = "STOPPED"
-        elif action == "PAUSE":
-            docker_utils.pause_container(container_name=container_name)
-            new_status = "PAUSED"
-        elif action == "UNPAUSE":
-            docker_utils.unpause_container(container_name=container_name)
-            new_status = "RUNNING"
-        elif action == "DELETE":
-            docker_utils.remove_container(container_name=container_name)
-            new_status = "TERMINATED"
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported action: {action}")
-
-        # Pass command to util function (assumes it can handle system-level docker commands)
-
-        updated_instance = await prisma.codeserverinstance.update(
-            where={"id": instance_id},
-            data={"status": new_status}
-        )
-
-        return SuccessResponse(
-            data={"message": f"Container '{container_name}' {action.lower()}ed successfully."},
-            status_code=200
-        )
-
+        # Transitions of one instance run one at a time, so two requests never snapshot or recreate it concurrently
+        async with instance_locks[instance_id]:
+            instance = await prisma.codeserverinstance.find_unique(
+                where={"id": instance_id},
+                include={"activities": True}
+            )
+
+            if not instance:
+                raise HTTPException(status_code=404, detail="Code server instance not found")
+
+            container_name = instance.name
+            action = actionableObject.action.upper()
+            new_status = None
+            update_data = {}
+            files_to_remove = []
+            rollback = None
+            after_update = None
+
+            docker_command = []
+
+            if action == "START":
+                docker_utils.start_container(container_name=container_name)
+                new_status = "RUNNING"
+            elif action == "STOP":
+                docker_utils.stop_container(container_name=container_name)
+                new_status = "STOPPED"
+            elif action == "PAUSE":
+                docker_utils.pause_container(container_name=container_name)
+                new_status = "PAUSED"
+            elif action == "UNPAUSE":
+                docker_utils.unpause_container(container_name=container_name)
+                new_status = "RUNNING"
+            elif action == "HIBERNATE":
+                if instance.status not in ("RUNNING", "PAUSED", "STOPPED"):
+                    raise HTTPException(status_code=400, detail=f"Cannot hibernate an instance in status {instance.status}")
+                if not instance.image:
+                    raise HTTPException(status_code=400, detail="Cannot hibernate an instance without a recorded image")
+                snapshot_path = os.path.join(get_snapshot_dir(), f"{instance.id}.tar.gz")
+                snapshot = await asyncio.to_thread(
+                    snapshot_utils.snapshot_container,
+                    container_name=container_name,
+                    snapshot_path=snapshot_path,
+                )
+                # The container is only removed once the DB points at its snapshot
+                rollback = lambda: snapshot_utils.abort_snapshot(container_name, snapshot_path, snapshot["paused"])
+                after_update = lambda: snapshot_utils.discard_container(container_name)
+                new_status = "HIBERNATED"
+                update_data = {
+                    "snapshotPath": snapshot_path,
+                    "snapshotDeletedPaths": Json(snapshot["deletedPaths"]),
+                    "snapshotSize": snapshot["snapshotSize"],
+                    "hibernateDurationMs": snapshot["durationMs"],
+                    "hibernatedAt": datetime.now(),
+                }
+            elif action == "RESUME":
+                if instance.status != "HIBERNATED" or not instance.snapshotPath:
+                    raise HTTPException(status_code=400, detail="Instance is not hibernated")
+                try:
+                    await pull_manager.ensure_image(instance.image)
+                except HTTPException:
+                    logger.warning(f"Pre-pull of '{instance.image}' failed, resuming with the local image")
+                resumed = await asyncio.to_thread(
+                    snapshot_utils.resume_container,
+                    container_name=container_name,
+                    image_name=instance.image,
+                    snapshot_path=instance.snapshotPath,
+                    deleted_paths=instance.snapshotDeletedPaths or [],
+                    port=instance.port,
+                )
+                new_status = "RUNNING"
+                update_data = {**CLEARED_SNAPSHOT, "resumeDurationMs": resumed["durationMs"]}
+                files_to_remove = [instance.snapshotPath]
+            elif action == "DELETE":
+                if instance.status == "HIBERNATED":
+                    update_data = CLEARED_SNAPSHOT
+                    files_to_remove = [instance.snapshotPath]
+                else:
+                    docker_utils.remove_container(container_name=container_name)
+                new_status = "TERMINATED"
+            else:
+                raise HTTPException(status_code=400, detail=f"Unsupported action: {action}")
+
+            # Pass command to util function (assumes it can handle system-level docker commands)
+
+            try:
+                updated_instance = await prisma.codeserverinstance.update(
+                    where={"id": instance_id},
+                    data={"status": new_status, **update_data}
+                )
+            except Exception:
+                if rollback:
+                    await asyncio.to_thread(rollback)
+                raise
+
+            if after_update:
+                await asyncio.to_thread(after_update)
+
+            # Snapshots are only dropped once the instance no longer points at them
+            for path in files_to_remove:
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+            return SuccessResponse(
+                data={"message": f"Container '{container_name}' {action.lower()}ed successfully."},
+                status_code=200
+            )
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error changing status of Code server instance {instance_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -6,6 +6,7 @@ from app.api.models.docker_scripts import CreateDockerScript, UpdateDockerScript
 from app.api.db.db import prisma
 from app.api.utils.logger_utils import get_logger
 from app.api.utils.docker_utils import log_generator
+from app.api.utils.image_pull_utils import get_base_images, pull_manager
 import traceback
 
 logger = get_logger("DockerScripts")
@@ -49,7 +50,20 @@ async def stream_docker_build_logs(script_id: str):
             raise HTTPException(status_code=404, detail="Script not found")
 
         fileobj = BytesIO(script.dockerFile.encode('utf-8'))
-        return StreamingResponse(log_generator(fileobj = fileobj,tag = script.tag, dockerScriptId=script.id), media_type="application/octet-stream")
+        await pull_manager.login_registries()
+
+        async def build_stream():
+            # Base images go through the pull manager (authenticated, shared with prefetch), so the build skips pulling
+            for base_image in get_base_images(script.dockerFile):
+                yield f"Pulling base image {base_image}\n"
+                try:
+                    await pull_manager.pull(base_image)
+                except HTTPException:
+                    yield f"[Warning] Could not pull {base_image}, using local image if present\n"
+            async for line in log_generator(fileobj = fileobj,tag = script.tag, dockerScriptId=script.id, pull=False):
+                yield line
+
+        return StreamingResponse(build_stream(), media_type="application/octet-stream")
 
     except Exception as e:
         logger.error(f"Error streaming Docker build logs: {e}")
@@ -0,0 +1,33 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status
+from app.api.models.images import PullImage
+from app.api.models.response import SuccessResponse
+from app.api.utils.image_pull_utils import pull_manager
+from app.api.utils.logger_utils import get_logger
+
+logger = get_logger("Images")
+
+image_router = APIRouter(prefix="/images", tags=["Image Pull Management"])
+
+
+@image_router.post("/pull", response_model=SuccessResponse, status_code=status.HTTP_201_CREATED)
+async def pull_image(pull_image: PullImage):
+    logger.info(f"Pull requested for image '{pull_image.image}'")
+    progress = await pull_manager.pull(pull_image.image)
+    return SuccessResponse(data=progress, status_code=201)
+
+
+@image_router.get("/pulls", response_model=SuccessResponse)
+async def get_pull_progress(image: Optional[str] = None):
+    return SuccessResponse(data=pull_manager.get_progress(image), status_code=200)
+
+
+@image_router.post("/prefetch", response_model=SuccessResponse)
+async def trigger_prefetch():
+    try:
+        images = await pull_manager.get_prefetch_images()
+    except Exception as e:
+        logger.error(f"Error collecting prefetch images: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    pull_manager.start_prefetch_once()
+    return SuccessResponse(data=images, status_code=200, message="Prefetch scheduled")
@@ -6,7 +6,8 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.db.db import connect_db, disconnect_db
 from app.api.models.response import SuccessResponse
-from app.api.v1 import code_server, template_scripts, credentials, docker_script
+from app.api.v1 import code_server, template_scripts, credentials, docker_script, images
+from app.api.utils.image_pull_utils import pull_manager
 
 origins = [
     "http://localhost:3000"
@@ -16,7 +17,10 @@ load_dotenv()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await connect_db()
+    if os.getenv("PREFETCH_ENABLED", "true").lower() == "true":
+        pull_manager.start_prefetch()
     yield
+    await pull_manager.stop_prefetch()
     await disconnect_db()
 
 app = FastAPI(
@@ -29,6 +33,7 @@ app.include_router(code_server.code_server_router)
 app.include_router(template_scripts.template_scripts_router)
 app.include_router(credentials.credential_router)
 app.include_router(docker_script.docker_script_router)
+app.include_router(images.image_router)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
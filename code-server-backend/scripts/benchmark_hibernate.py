@@ -0,0 +1,66 @@
+"""Benchmarks hibernate/resume of a code-server container.
+
+Usage: python -m scripts.benchmark_hibernate [image] [iterations] [state_mb]
+
+Writes `state_mb` MB of random data into the container's writable layer before each
+hibernate, then reports snapshot size, hibernate time and two resume times per iteration:
+until the container is started, and until code-server answers on /healthz.
+"""
+import os
+import sys
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.api.utils import docker_utils, snapshot_utils
+from app.api.utils.network_utils import get_safe_port, wait_until_ready
+
+CONTAINER_NAME = "code-server-hibernate-benchmark"
+
+
+def main():
+    image = sys.argv[1] if len(sys.argv) > 1 else "codercom/code-server:latest"
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    state_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "benchmark.tar.gz")
+    port = get_safe_port()
+    health_url = f"http://{os.getenv('BASE_API_HOST') or '127.0.0.1'}:{port}/healthz"
+
+    result = docker_utils.run_code_server_container(container_name=CONTAINER_NAME, image_name=image, port=port)
+    if result.returncode != 0:
+        sys.exit(f"Could not start benchmark container: {result.stderr}")
+
+    rows = []
+    try:
+        if not wait_until_ready(health_url):
+            sys.exit(f"code-server did not become ready on {health_url}")
+        for iteration in range(1, iterations + 1):
+            docker_utils.perform_docker_actions(
+                container_name=CONTAINER_NAME,
+                commands=[f"dd if=/dev/urandom of=/tmp/state-{iteration} bs=1M count={state_mb}"],
+                user="root",
+            )
+            snapshot = snapshot_utils.snapshot_container(CONTAINER_NAME, snapshot_path)
+            snapshot_utils.discard_container(CONTAINER_NAME)
+            resume_started = time.monotonic()
+            resumed = snapshot_utils.resume_container(CONTAINER_NAME, image, snapshot_path, snapshot["deletedPaths"], port)
+            if not wait_until_ready(health_url):
+                sys.exit(f"code-server did not become ready on {health_url} after resume")
+            ready_ms = int((time.monotonic() - resume_started) * 1000)
+            rows.append((iteration, snapshot["snapshotSize"], snapshot["durationMs"], resumed["durationMs"], ready_ms))
+            os.remove(snapshot_path)
+    finally:
+        try:
+            docker_utils.client.containers.get(CONTAINER_NAME).remove(force=True)
+        except Exception:
+            pass
+
+    print(f"{'iteration':>9} {'snapshot MB':>12} {'hibernate ms':>13} {'started ms':>11} {'ready ms':>9}")
+    for iteration, size, hibernate_ms, started_ms, ready_ms in rows:
+        print(f"{iteration:>9} {size / 1024 / 1024:>12.1f} {hibernate_ms:>13} {started_ms:>11} {ready_ms:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import asyncio
+import threading
+import time
+import uuid
+from unittest import mock
+import pytest
+
+from app.api.models.images import ImagePullProgress, PullStatus
+from app.api.utils import image_pull_utils
+from app.api.utils.image_pull_utils import (
+    ImagePullManager,
+    canonical_image,
+    get_base_images,
+    get_credential_registry,
+    get_mirror_repository,
+    normalize_image,
+)
+
+
+def make_manager(monkeypatch, auth_configs=None):
+    manager = ImagePullManager()
+
+    async def get_auth_configs():
+        return auth_configs or {}
+
+    monkeypatch.setattr(manager, "get_auth_configs", get_auth_configs)
+    return manager
+
+
+def test_normalize_image():
+    assert normalize_image("ubuntu") == "ubuntu:latest"
+    assert normalize_image("ghcr.io/foo/bar:1.2") == "ghcr.io/foo/bar:1.2"
+    assert normalize_image("localhost:5000/foo") == "localhost:5000/foo:latest"
+    assert normalize_image("foo@sha256:abc") == "foo@sha256:abc"
+
+
+def test_canonical_image():
+    assert canonical_image("ubuntu") == "docker.io/library/ubuntu:latest"
+    assert canonical_image("docker.io/library/ubuntu:latest") == "docker.io/library/ubuntu:latest"
+    assert canonical_image("index.docker.io/library/ubuntu") == "docker.io/library/ubuntu:latest"
+    assert canonical_image("codercom/code-server") == "docker.io/codercom/code-server:latest"
+    assert canonical_image("ghcr.io/foo/bar:1.0") == "ghcr.io/foo/bar:1.0"
+    assert canonical_image("foo@sha256:abc") == "docker.io/library/foo@sha256:abc"
+
+
+def test_get_base_images():
+    docker_file = "\n".join([
+        "ARG BASE=node:18",
+        "FROM --platform=linux/amd64 node:18 AS build",
+        "FROM ${BASE}",
+        "FROM build AS test",
+        "FROM scratch",
+        "from codercom/code-server",
+        "FROM Build",
+        "FROM node:18",
+    ])
+    assert get_base_images(docker_file) == ["node:18", "codercom/code-server:latest"]
+
+
+def test_get_credential_registry():
+    assert get_credential_registry("DOCKERHUB", "https://hub.docker.com") == "docker.io"
+    assert get_credential_registry("DOCKERHUB", "https://my-registry.example.com") == "docker.io"
+    assert get_credential_registry("GITHUB_CONTAINER", "https://ghcr.io") == "ghcr.io"
+    assert get_credential_registry("GITHUB_CONTAINER", "https://github.com/org") == "ghcr.io"
+    assert get_credential_registry("GITHUB_CONTAINER", "") == "ghcr.io"
+    assert get_credential_registry("GITHUB_CONTAINER", "https://ghcr.example.com/") == "ghcr.example.com"
+
+
+def test_get_mirror_repository():
+    assert get_mirror_repository("localhost:5000", "ubuntu") == "localhost:5000/library/ubuntu"
+    assert get_mirror_repository("localhost:5000", "foo/bar") == "localhost:5000/foo/bar"
+    assert get_mirror_repository("localhost:5000", "docker.io/foo/bar") == "localhost:5000/foo/bar"
+    assert get_mirror_repository("localhost:5000", "ghcr.io/foo/bar") == "localhost:5000/ghcr.io/foo/bar"
+
+
+def test_record_progress():
+    manager = ImagePullManager()
+    progress = ImagePullProgress(image="ubuntu:latest")
+    chunks = [
+        {"status": "Pulling from library/ubuntu", "id": "latest"},
+        {"status": "Pulling fs layer", "progressDetail": {}, "id": "a"},
+        {"status": "Pulling fs layer", "progressDetail": {}, "id": "b"},
+        {"status": "Downloading", "progressDetail": {"current": 10, "total": 100}, "id": "a"},
+        {"status": "Downloading", "progressDetail": {"current": 5, "total": 50}, "id": "b"},
+        {"status": "Download complete", "progressDetail": {}, "id": "b"},
+        {"status": "Extracting", "progressDetail": {"current": 1, "total": 50}, "id": "b"},
+    ]
+    for chunk in chunks:
+        manager._record_progress(progress, chunk)
+
+    assert set(progress.layers) == {"a", "b"}
+    assert progress.layers["a"].current == 10
+    assert progress.layers["b"].current == 50
+    assert progress.downloadedBytes == 60
+    assert progress.totalBytes == 150
+
+
+def test_get_progress_returns_copies(monkeypatch):
+    manager = make_manager(monkeypatch)
+    key = "docker.io/library/ubuntu:latest"
+    manager._progress[key] = ImagePullProgress(image=key)
+
+    snapshot = manager.get_progress("ubuntu")[0]
+    manager._record_progress(
+        manager._progress[key],
+        {"status": "Downloading", "progressDetail": {"current": 1, "total": 2}, "id": "a"},
+    )
+    assert snapshot.layers == {}
+
+
+def test_finished_progress_is_evicted(monkeypatch):
+    monkeypatch.setenv("PULL_PROGRESS_MAX_ENTRIES", "2")
+    manager = ImagePullManager()
+    for index in range(4):
+        progress = ImagePullProgress(image=f"image-{index}:latest", status=PullStatus.SUCCESS)
+        progress.completedAt = image_pull_utils.datetime.fromtimestamp(1_700_000_000 + index)
+        manager._progress[progress.image] = progress
+    manager._progress["running:latest"] = ImagePullProgress(image="running:latest", status=PullStatus.PULLING)
+
+    monkeypatch.setenv("PULL_PROGRESS_TTL_SECONDS", str(10 ** 10))
+    manager._evict_finished_progress()
+    assert set(manager._progress) == {"image-3:latest", "running:latest"}
+
+    monkeypatch.setenv("PULL_PROGRESS_TTL_SECONDS", "0")
+    manager._evict_finished_progress()
+    assert set(manager._progress) == {"running:latest"}
+
+
+def test_concurrent_pulls_are_deduplicated(monkeypatch):
+    manager = make_manager(monkeypatch)
+    calls = []
+    lock = threading.Lock()
+
+    def pull_blocking(image, auth_configs, progress):
+        with lock:
+            calls.append(image)
+        time.sleep(0.1)
+
+    monkeypatch.setattr(manager, "_pull_blocking", pull_blocking)
+
+    async def run():
+        return await asyncio.gather(
+            manager.pull("ubuntu"),
+            manager.pull("ubuntu:latest"),
+            manager.pull("docker.io/library/debian"),
+        )
+
+    results = asyncio.run(run())
+    assert sorted(calls) == ["docker.io/library/debian:latest", "ubuntu:latest"]
+    assert results[0] is results[1]
+    assert results[0].image == "docker.io/library/ubuntu:latest"
+    assert results[0].status == PullStatus.SUCCESS
+    assert manager._inflight == {}
+
+
+def test_aliased_references_share_one_pull(monkeypatch):
+    manager = make_manager(monkeypatch)
+    calls = []
+
+    def pull_blocking(image, auth_configs, progress):
+        calls.append(image)
+        time.sleep(0.1)
+
+    monkeypatch.setattr(manager, "_pull_blocking", pull_blocking)
+
+    async def run():
+        return await asyncio.gather(
+            manager.pull("ubuntu"),
+            manager.pull("docker.io/library/ubuntu"),
+            manager.pull("index.docker.io/library/ubuntu:latest"),
+        )
+
+    results = asyncio.run(run())
+    assert calls == ["ubuntu:latest"]
+    assert results[0] is results[1] is results[2]
+    assert len(manager.get_progress("docker.io/library/ubuntu")) == 1
+
+
+def test_pull_failure_is_reported(monkeypatch):
+    manager = make_manager(monkeypatch)
+
+    def pull_blocking(image, auth_configs, progress):
+        raise RuntimeError("manifest unknown")
+
+    monkeypatch.setattr(manager, "_pull_blocking", pull_blocking)
+
+    with pytest.raises(image_pull_utils.HTTPException):
+        asyncio.run(manager.pull("missing"))
+    progress = manager.get_progress("missing")[0]
+    assert progress.status == PullStatus.FAILED
+    assert progress.error == "manifest unknown"
+
+
+def fake_docker_client(failing_prefix=None):
+    fake_client = mock.MagicMock()
+
+    def pull(repository, tag=None, **kwargs):
+        if failing_prefix and repository.startswith(failing_prefix):
+            return iter([{"error": "not found"}])
+        return iter([{"status": "Downloading", "progressDetail": {"current": 3, "total": 3}, "id": "a"}])
+
+    fake_client.api.pull.side_effect = pull
+    return fake_client
+
+
+def test_mirror_falls_back_to_upstream(monkeypatch):
+    monkeypatch.setenv("REGISTRY_MIRROR", "localhost:5000")
+    fake_client = fake_docker_client(failing_prefix="localhost:5000")
+    monkeypatch.setattr(image_pull_utils, "client", fake_client)
+    auth = {"username": "user", "password": "token"}
+    manager = make_manager(monkeypatch, auth_configs={"docker.io": auth})
+
+    progress = asyncio.run(manager.pull("ubuntu"))
+
+    assert [c.args[0] for c in fake_client.api.pull.call_args_list] == ["localhost:5000/library/ubuntu", "ubuntu"]
+    assert fake_client.api.pull.call_args_list[0].kwargs["auth_config"] is None
+    assert fake_client.api.pull.call_args_list[1].kwargs["auth_config"] == auth
+    assert progress.source == "ubuntu"
+    fake_client.api.tag.assert_not_called()
+
+
+def test_mirror_pull_is_retagged(monkeypatch):
+    monkeypatch.setenv("REGISTRY_MIRROR", "localhost:5000")
+    fake_client = fake_docker_client()
+    monkeypatch.setattr(image_pull_utils, "client", fake_client)
+    manager = make_manager(monkeypatch)
+
+    asyncio.run(manager.pull("ghcr.io/foo/bar:1.0"))
+    asyncio.run(manager.pull("foo@sha256:abc"))
+
+    fake_client.api.tag.assert_called_once_with("localhost:5000/ghcr.io/foo/bar:1.0", "ghcr.io/foo/bar", "1.0")
+
+
+@pytest.mark.docker
+def test_pull_from_local_stand_in_registry(monkeypatch):
+    from app.api.utils.network_utils import get_safe_port
+
+    client = image_pull_utils.client
+    try:
+        client.images.pull("busybox", tag="latest")
+    except Exception as e:
+        pytest.skip(f"Cannot pull busybox: {e}")
+
+    name = f"code-server-registry-test-{uuid.uuid4().hex[:8]}"
+    image = f"code-server-test/busybox:{uuid.uuid4().hex[:8]}"
+    registry = image_pull_utils.ensure_local_registry(port=get_safe_port(), name=name)
+    try:
+        client.api.tag("busybox:latest", *image.split(":"))
+        for _ in range(30):
+            try:
+                mirrored = image_pull_utils.seed_local_registry(image, registry)
+                break
+            except Exception:
+                time.sleep(0.5)
+        else:
+            pytest.fail("Local registry did not accept pushes")
+        client.images.remove(image)
+        client.images.remove(mirrored)
+
+        monkeypatch.setenv("REGISTRY_MIRROR", registry)
+        manager = make_manager(monkeypatch)
+        progress = asyncio.run(manager.pull(image))
+
+        assert progress.status == PullStatus.SUCCESS
+        assert progress.source == f"{registry}/code-server-test/busybox"
+        assert image_pull_utils.image_exists(image)
+    finally:
+        for leftover in (image, f"{registry}/code-server-test/busybox:{image.split(':')[1]}"):
+            try:
+                client.images.remove(leftover)
+            except Exception:
+                pass
+        client.containers.get(name).remove(force=True)
@@ -0,0 +1,122 @@
+import io
+import tarfile
+from unittest import mock
+
+from app.api.utils import snapshot_utils
+from app.api.utils.snapshot_utils import (
+    CHANGE_ADDED,
+    CHANGE_DELETED,
+    CHANGE_MODIFIED,
+    _StreamReader,
+    plan_snapshot,
+    write_snapshot,
+)
+
+
+def make_tar(entries) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            info.uid, info.mode, info.mtime = 1000, 0o750, 1_700_000_000
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                archive.addfile(info)
+            else:
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def chunked(data: bytes, size: int = 7):
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+def test_stream_reader_joins_chunks():
+    reader = io.BufferedReader(_StreamReader(iter([b"ab", b"", b"cde", b"f"])))
+    assert reader.read() == b"abcdef"
+
+
+def test_plan_snapshot():
+    changes = [
+        {"Path": "/home", "Kind": CHANGE_MODIFIED},
+        {"Path": "/home/coder", "Kind": CHANGE_MODIFIED},
+        {"Path": "/home/coder/project", "Kind": CHANGE_ADDED},
+        {"Path": "/home/coder/project/node_modules", "Kind": CHANGE_ADDED},
+        {"Path": "/home/coder/project-notes.md", "Kind": CHANGE_ADDED},
+        {"Path": "/home/coder/.bashrc", "Kind": CHANGE_MODIFIED},
+        {"Path": "/usr/share/doc", "Kind": CHANGE_DELETED},
+        {"Path": "/usr/share/doc/bash", "Kind": CHANGE_DELETED},
+        {"Path": "/usr/share", "Kind": CHANGE_MODIFIED},
+        {"Path": "/usr", "Kind": CHANGE_MODIFIED},
+        {"Path": "/etc", "Kind": CHANGE_MODIFIED},
+        {"Path": "/etc/hosts", "Kind": CHANGE_MODIFIED},
+        {"Path": "/dev/pts", "Kind": CHANGE_ADDED},
+    ]
+    added_paths, modified_paths, deleted_paths = plan_snapshot(changes)
+    assert added_paths == ["/home/coder/project", "/home/coder/project-notes.md"]
+    assert modified_paths == ["/etc", "/home", "/home/coder", "/home/coder/.bashrc", "/usr", "/usr/share"]
+    assert deleted_paths == ["/usr/share/doc"]
+
+
+def test_plan_snapshot_modified_directory_without_children():
+    # Overlay keeps a copied-up directory after its new child is removed again
+    added_paths, modified_paths, deleted_paths = plan_snapshot([
+        {"Path": "/usr", "Kind": CHANGE_MODIFIED},
+        {"Path": "/tmp", "Kind": CHANGE_MODIFIED},
+    ])
+    assert (added_paths, modified_paths, deleted_paths) == ([], ["/tmp", "/usr"], [])
+
+
+def fake_open_archive(archives, opened):
+    def open_archive(container, path):
+        response = mock.MagicMock()
+        response.iter_content.side_effect = lambda chunk_size: iter(chunked(archives[path]))
+        opened.append((path, response))
+        return response
+    return open_archive
+
+
+def test_write_snapshot_prefixes_archived_paths(tmp_path, monkeypatch):
+    archives = {
+        "/home/coder": make_tar([("coder", None), ("coder/base-file", b"from the image\n")]),
+        "/home/coder/project": make_tar([("project", None), ("project/main.py", b"print(1)\n")]),
+        "/home/coder/.bashrc": make_tar([(".bashrc", b"export A=1\n")]),
+    }
+    opened = []
+    monkeypatch.setattr(snapshot_utils, "_open_archive", fake_open_archive(archives, opened))
+    container = mock.MagicMock()
+    container.diff.return_value = [
+        {"Path": "/home/coder", "Kind": CHANGE_MODIFIED},
+        {"Path": "/home/coder/project", "Kind": CHANGE_ADDED},
+        {"Path": "/home/coder/project/main.py", "Kind": CHANGE_ADDED},
+        {"Path": "/home/coder/.bashrc", "Kind": CHANGE_MODIFIED},
+        {"Path": "/tmp/cache", "Kind": CHANGE_DELETED},
+    ]
+    snapshot_path = tmp_path / "snapshot.tar.gz"
+
+    deleted_paths = write_snapshot(container, str(snapshot_path))
+
+    assert deleted_paths == ["/tmp/cache"]
+    with tarfile.open(snapshot_path, "r:gz") as snapshot:
+        assert snapshot.getnames() == [
+            "home/coder", "home/coder/.bashrc", "home/coder/project", "home/coder/project/main.py",
+        ]
+        assert snapshot.extractfile("home/coder/project/main.py").read() == b"print(1)\n"
+    assert all(response.close.called for _, response in opened)
+
+
+def test_write_snapshot_keeps_only_header_of_modified_directory(tmp_path, monkeypatch):
+    archives = {"/usr": make_tar([("usr", None), ("usr/bin", None), ("usr/bin/bash", b"\x7fELF" * 100)])}
+    monkeypatch.setattr(snapshot_utils, "_open_archive", fake_open_archive(archives, []))
+    container = mock.MagicMock()
+    container.diff.return_value = [{"Path": "/usr", "Kind": CHANGE_MODIFIED}]
+    snapshot_path = tmp_path / "snapshot.tar.gz"
+
+    write_snapshot(container, str(snapshot_path))
+
+    with tarfile.open(snapshot_path, "r:gz") as snapshot:
+        members = snapshot.getmembers()
+    assert [member.name for member in members] == ["usr"]
+    assert members[0].isdir()
+    assert (members[0].uid, members[0].mode, members[0].mtime) == (1000, 0o750, 1_700_000_000)
@@ -107,6 +107,7 @@ function getStatusBadge(status: InstanceStatus) {
     PENDING: "secondary",
     PAUSED: "outline",
     STOPPED: "outline",
+    HIBERNATED: "outline",
     TERMINATED: "destructive",
     ERROR: "destructive",
   };
@@ -116,6 +117,7 @@ function getStatusBadge(status: InstanceStatus) {
     PENDING: "bg-yellow-100 text-yellow-800",
     PAUSED: "bg-blue-100 text-blue-800",
     STOPPED: "bg-gray-100 text-gray-800",
+    HIBERNATED: "bg-indigo-100 text-indigo-800",
     TERMINATED: "bg-red-100 text-red-800",
     ERROR: "bg-red-100 text-red-800",
   };
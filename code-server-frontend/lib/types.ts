@@ -13,6 +13,7 @@ export enum InstanceStatus {
   RUNNING = "RUNNING",
   PAUSED = "PAUSED",
   STOPPED = "STOPPED",
+  HIBERNATED = "HIBERNATED",
   TERMINATED = "TERMINATED",
   ERROR = "ERROR",
 }